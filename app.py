@@ -1,14 +1,20 @@
 from flask import Flask, request, jsonify, send_file, send_from_directory
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-from data_processor import DataProcessor
 import os
+import json
+import shutil
+import hashlib
+import tempfile
 import logging
-import pandas as pd
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from sqlalchemy import func, inspect, text
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
 import secrets
+import threading
+import time
 
 # ─── Logging structuré ────────────────────────────────────────────────────────
 logging.basicConfig(
@@ -56,6 +62,9 @@ class Session(db.Model):
 
 class UserFile(db.Model):
     """Historique des fichiers uploadés par utilisateur."""
+    # Index composite pour la pagination par curseur (username, id)
+    __table_args__ = (db.Index('ix_user_file_username_id', 'username', 'id'),)
+
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), nullable=False)
     filename = db.Column(db.String(200), nullable=False)
@@ -63,33 +72,152 @@ class UserFile(db.Model):
     rows = db.Column(db.Integer, default=0)
     columns = db.Column(db.Integer, default=0)
     status = db.Column(db.String(50), default='uploaded')
+    content_hash = db.Column(db.String(64), index=True)
+    dataset_id = db.Column(db.Integer, index=True)
+
+
+class UserStats(db.Model):
+    """Compteurs agrégés par utilisateur, maintenus à l'insertion et à la suppression."""
+    username = db.Column(db.String(80), primary_key=True)
+    total_files = db.Column(db.Integer, nullable=False, default=0)
+    total_rows = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class Dataset(db.Model):
+    """Dataset alimenté par ajouts successifs de lignes (voir incremental.py).
+
+    Les fichiers UserFile qui l'alimentent portent son id ; l'état du
+    traitement incrémental est stocké dans DATASET_FOLDER/<id>.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), nullable=False, index=True)
+    name = db.Column(db.String(200), nullable=False)
+    options = db.Column(db.Text, nullable=False)
+    drift_threshold = db.Column(db.Float)
+    processed_filename = db.Column(db.String(200))
+    total_rows = db.Column(db.Integer, default=0)
+    # Incrémentée à chaque mise à jour : détecte les ajouts concurrents
+    version = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class AnalysisCache(db.Model):
+    """Résultats d'analyse adressés par contenu (SHA-256), partagés entre utilisateurs.
+
+    Ne contient que des statistiques dérivées du contenu : seul un utilisateur
+    qui envoie exactement les mêmes octets peut obtenir une entrée en cache, et
+    la réponse ne signale le cache que pour ses propres uploads.
+    """
+    content_hash = db.Column(db.String(64), primary_key=True)
+    file_type = db.Column(db.String(10), primary_key=True)
+    analysis = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+def add_missing_columns():
+    """Ajoute les colonnes nullables absentes des tables existantes (create_all ne le fait pas)."""
+    inspector = inspect(db.engine)
+    preparer = db.engine.dialect.identifier_preparer
+    for table in db.metadata.sorted_tables:
+        existing = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            with db.engine.begin() as conn:
+                conn.execute(text(
+                    f"ALTER TABLE {preparer.quote(table.name)} "
+                    f"ADD COLUMN {preparer.quote(column.name)} {column_type}"
+                ))
+            logger.info(f"Colonne ajoutée : {table.name}.{column.name}")
 
 
 # ─── Initialisation de la base de données ────────────────────────────────────
-with app.app_context():
-    db.create_all()
-    if not User.query.filter_by(username='admin').first():
-        admin_password = os.environ.get('ADMIN_PASSWORD', 'admin123')
-        admin = User(
-            username='admin',
-            password_hash=generate_password_hash(admin_password)
-        )
-        db.session.add(admin)
-        db.session.commit()
-        logger.info("Utilisateur admin créé.")
+# Exécutée une seule fois au déploiement (`flask --app app init-db`) et non plus
+# à l'import, pour ne pas la rejouer dans chaque worker gunicorn.
+
+def init_db():
+    with app.app_context():
+        db.create_all()
+        add_missing_columns()
+        if not User.query.filter_by(username='admin').first():
+            admin_password = os.environ.get('ADMIN_PASSWORD', 'admin123')
+            admin = User(
+                username='admin',
+                password_hash=generate_password_hash(admin_password)
+            )
+            db.session.add(admin)
+            db.session.commit()
+            logger.info("Utilisateur admin créé.")
+        # create_all n'ajoute pas les index aux tables déjà existantes
+        for index in (*UserFile.__table__.indexes, *AnalysisCache.__table__.indexes):
+            index.create(db.engine, checkfirst=True)
+
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Crée les tables, colonnes et index manquants ainsi que l'utilisateur admin."""
+    init_db()
+    logger.info("Base de données initialisée.")
+    removed = prune_columnar()
+    if removed:
+        logger.info(f"{removed} copie(s) colonnaire(s) orpheline(s) supprimée(s)")
 
 # ─── Configuration des dossiers ───────────────────────────────────────────────
 UPLOAD_FOLDER = 'uploads'
 PROCESSED_FOLDER = 'processed'
+DATASET_FOLDER = 'datasets'
+# Copie Parquet des sorties traitées, interrogée par /api/query
+COLUMNAR_FOLDER = os.path.join(PROCESSED_FOLDER, '.columnar')
 ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'xls', 'json', 'xml'}
 
+# Stockage adressé par contenu : un blob par SHA-256, les uploads en sont des liens durs
+BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, '.blobs')
+HASH_CHUNK_SIZE = 1024 * 1024
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get('ANALYSIS_CACHE_MAX_ENTRIES', 10000))
+ANALYSIS_CACHE_EVICT_MARGIN = max(ANALYSIS_CACHE_MAX_ENTRIES // 10, 1)
+
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+os.makedirs(BLOB_FOLDER, exist_ok=True)
 os.makedirs(PROCESSED_FOLDER, exist_ok=True)
+os.makedirs(DATASET_FOLDER, exist_ok=True)
+os.makedirs(COLUMNAR_FOLDER, exist_ok=True)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['PROCESSED_FOLDER'] = PROCESSED_FOLDER
 
-processor = DataProcessor()
+# ─── Chargement paresseux du moteur de traitement ────────────────────────────
+# pandas/numpy ne sont importés qu'au premier traitement ; scikit-learn et
+# openpyxl seulement quand la normalisation ou un fichier Excel le demandent.
+# DataProcessor étant sans état, une seule instance sert tous les threads.
+_processor = None
+_processor_lock = threading.Lock()
+
+
+def get_processor():
+    global _processor
+    if _processor is None:
+        with _processor_lock:
+            if _processor is None:
+                from data_processor import DataProcessor
+                # CSV_ENGINE=arrow : ingestion CSV via pyarrow (voir DataProcessor)
+                _processor = DataProcessor(csv_engine=os.environ.get('CSV_ENGINE', 'pandas'))
+    return _processor
+
+
+def get_incremental():
+    from incremental import IncrementalProcessor
+    return IncrementalProcessor(get_processor())
+
+
+def warm_up():
+    """Précharge les bibliothèques lourdes dans le maître gunicorn (preload_app).
+
+    Les workers forkés partagent alors ces pages mémoire en copy-on-write.
+    """
+    get_processor()
+    import sklearn.preprocessing  # noqa: F401
 
 # ─── Gestionnaire d'erreur fichier trop lourd ─────────────────────────────────
 @app.errorhandler(413)
@@ -106,6 +234,205 @@ def get_user_from_token():
     return session.username if session else None
 
 
+def aggregate_user_files(username):
+    """(nombre de fichiers, total de lignes) calculés en SQL sur UserFile."""
+    return db.session.query(
+        func.count(UserFile.id), func.coalesce(func.sum(UserFile.rows), 0)
+    ).filter(UserFile.username == username).one()
+
+
+def get_user_stats(username):
+    """Lecture seule : compteurs maintenus s'ils existent, sinon agrégat SQL."""
+    stats = db.session.get(UserStats, username)
+    if stats is None:
+        return aggregate_user_files(username)
+    return stats.total_files, stats.total_rows
+
+
+def ensure_user_stats(username):
+    """Crée la ligne de compteurs (initialisée depuis UserFile) avant une première écriture."""
+    if db.session.get(UserStats, username) is not None:
+        return
+    total_files, total_rows = aggregate_user_files(username)
+    db.session.add(UserStats(username=username, total_files=total_files, total_rows=total_rows))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Une autre requête a créé la ligne entre-temps
+        db.session.rollback()
+
+
+def update_user_stats(username, files_delta, rows_delta):
+    """Applique un incrément atomique côté SQL (sans commit)."""
+    ensure_user_stats(username)
+    UserStats.query.filter_by(username=username).update({
+        UserStats.total_files: UserStats.total_files + files_delta,
+        UserStats.total_rows: UserStats.total_rows + rows_delta
+    }, synchronize_session=False)
+
+
+def user_upload_path(username, filename):
+    """Chemin d'upload dans le dossier propre à l'utilisateur.
+
+    Deux comptes qui envoient le même nom de fichier ne peuvent ni remplacer
+    ni supprimer le fichier de l'autre.
+    """
+    folder = secure_filename(username)
+    if folder != username:
+        # Nom non représentable tel quel : empreinte pour éviter les collisions
+        folder = hashlib.sha256(username.encode('utf-8')).hexdigest()
+    folder = os.path.join(app.config['UPLOAD_FOLDER'], folder)
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, filename)
+
+
+def save_upload(file, file_path, previous_hash=None):
+    """Enregistre l'upload en calculant son SHA-256 au fil de l'écriture.
+
+    Le contenu n'est écrit qu'une fois dans BLOB_FOLDER ; file_path devient un
+    lien dur vers ce blob (copie privée si le système de fichiers ne le permet
+    pas). Le blob vit tant qu'un lien y pointe (voir release_upload) :
+    previous_hash, l'empreinte du fichier que file_path remplace, est libéré
+    s'il diffère du nouveau contenu.
+    Retourne l'empreinte hexadécimale du contenu.
+    """
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=BLOB_FOLDER)
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            for chunk in iter(lambda: file.stream.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                tmp.write(chunk)
+        content_hash = digest.hexdigest()
+        blob_path = os.path.join(BLOB_FOLDER, content_hash)
+
+        # Lien créé sous un nom temporaire puis renommé : remplacement atomique
+        # même si deux requêtes envoient le même nom de fichier en parallèle
+        link_path = f"{file_path}.{secrets.token_hex(8)}.tmp"
+        try:
+            try:
+                os.link(blob_path, link_path)
+            except FileNotFoundError:
+                # Nouveau contenu : le lien existe avant que le blob soit visible,
+                # un release_blob concurrent ne peut donc pas le supprimer
+                os.chmod(tmp_path, 0o644)
+                os.link(tmp_path, link_path)
+                os.replace(tmp_path, blob_path)
+        except OSError:
+            # Pas de liens durs : copie privée
+            if not os.path.exists(link_path):
+                os.replace(tmp_path, link_path)
+        os.replace(link_path, file_path)
+        # Même contenu sous le même nom : file_path est déjà un lien vers ce
+        # blob, le renommage n'a rien fait et le lien temporaire subsiste
+        if os.path.exists(link_path):
+            os.remove(link_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    if previous_hash and previous_hash != content_hash:
+        release_blob(previous_hash)
+    return content_hash
+
+
+def hash_file(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def release_blob(content_hash):
+    """Supprime le blob s'il n'est plus référencé par aucun upload."""
+    blob_path = os.path.join(BLOB_FOLDER, content_hash)
+    try:
+        if os.stat(blob_path).st_nlink == 1:
+            os.remove(blob_path)
+            logger.info(f"Contenu supprimé : {content_hash[:12]}")
+    except FileNotFoundError:
+        pass
+
+
+def latest_upload_hash(username, filename):
+    """Empreinte du dernier upload enregistré sous ce nom (None si inconnu)."""
+    file_info = UserFile.query.filter_by(username=username, filename=filename) \
+        .order_by(UserFile.id.desc()).first()
+    return file_info.content_hash if file_info else None
+
+
+def release_upload(file_path, content_hash=None):
+    """Supprime un upload ; son blob part avec le dernier lien.
+
+    content_hash évite de relire le fichier pour retrouver son blob ; il n'est
+    recalculé que pour un upload sans UserFile connu.
+
+    L'analyse en cache est conservée : le même export renvoyé plus tard
+    (après /api/process par exemple) reste servi depuis le cache, borné par
+    ANALYSIS_CACHE_MAX_ENTRIES.
+    """
+    try:
+        if os.stat(file_path).st_nlink == 1:
+            content_hash = None  # copie privée : aucun blob à libérer
+        elif content_hash is None:
+            content_hash = hash_file(file_path)
+        os.remove(file_path)
+    except FileNotFoundError:
+        return
+    except OSError as e:
+        logger.warning(f"Impossible de supprimer le fichier {file_path}: {e}")
+        return
+
+    if content_hash:
+        release_blob(content_hash)
+
+
+def analysis_cache_type(file_type, processor):
+    """Type stocké dans la clé du cache : les dtypes d'un CSV dépendent du moteur de lecture."""
+    if file_type == 'csv':
+        return f"csv:{processor.csv_engine}"
+    return file_type
+
+
+def get_cached_analysis(content_hash, file_type):
+    cached = db.session.get(AnalysisCache, (content_hash, file_type))
+    return json.loads(cached.analysis) if cached else None
+
+
+def store_analysis(content_hash, file_type, analysis):
+    db.session.add(AnalysisCache(
+        content_hash=content_hash, file_type=file_type, analysis=json.dumps(analysis)
+    ))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Même contenu analysé en parallèle par une autre requête
+        db.session.rollback()
+        return
+
+    # Éviction par lots : déclenchée une fois la marge dépassée, elle ramène le
+    # cache aux ANALYSIS_CACHE_MAX_ENTRIES entrées les plus récentes (index sur created_at)
+    newest = db.session.query(AnalysisCache.created_at).order_by(AnalysisCache.created_at.desc())
+    if newest.offset(ANALYSIS_CACHE_MAX_ENTRIES + ANALYSIS_CACHE_EVICT_MARGIN).first() is None:
+        return
+    cutoff = newest.offset(ANALYSIS_CACHE_MAX_ENTRIES).first()[0]
+    evicted = AnalysisCache.query.filter(AnalysisCache.created_at <= cutoff) \
+        .delete(synchronize_session=False)
+    db.session.commit()
+    logger.info(f"Cache d'analyse : {evicted} entrées évincées")
+
+
+def serialize_user_file(f):
+    return {
+        'filename': f.filename,
+        'upload_date': f.upload_date,
+        'rows': f.rows,
+        'columns': f.columns,
+        'status': f.status
+    }
+
+
 def allowed_file(filename):
     if '.' not in filename:
         logger.warning(f"Fichier sans extension rejeté : {filename}")
@@ -126,6 +453,7 @@ VALID_OUTLIER_METHODS = {'iqr', 'zscore'}
 VALID_OUTLIER_ACTIONS = {'cap', 'remove'}
 VALID_OUTPUT_FORMATS = {'csv', 'excel', 'json'}
 VALID_NORMALIZATIONS = {'standard', 'minmax', 'none'}
+VALID_ANALYSIS_MODES = {'exact', 'approx'}
 
 
 def validate_options(options):
@@ -248,26 +576,60 @@ def analyze_file():
     if not file.filename or not allowed_file(file.filename):
         return jsonify({'error': 'Fichier invalide ou format non supporté'}), 400
 
+    processor = get_processor()
+
+    # Mode 'approx' : analyse en un passage par échantillonnage et sketches (mémoire constante)
+    mode = request.form.get('mode', 'exact')
+    if mode not in VALID_ANALYSIS_MODES:
+        return jsonify({'error': f"mode invalide. Valeurs acceptées : {VALID_ANALYSIS_MODES}"}), 400
+
     filename = secure_filename(file.filename)
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(file_path)
+    file_path = user_upload_path(username, filename)
+    # Contenu actuellement enregistré sous ce nom : son blob est libéré s'il est remplacé
+    content_hash = save_upload(file, file_path, latest_upload_hash(username, filename))
 
     file_type = get_file_type(filename)
+    cache_type = analysis_cache_type(file_type, processor)
 
     try:
-        df = processor.load_file(file_path, file_type)
-        analysis = processor.analyze_data(df)
+        analysis = get_cached_analysis(content_hash, cache_type)
+        cached = analysis is not None
+        if cached:
+            logger.info(f"Analyse en cache pour {filename} ({content_hash[:12]})")
+        elif mode == 'approx':
+            # Résultat approximatif : jamais mis en cache à la place d'une analyse exacte
+            analysis = processor.analyze_data_approx(processor.iter_chunks(file_path, file_type))
+        else:
+            df = processor.load_file(file_path, file_type)
+            analysis = processor.analyze_data(df)
+            store_analysis(content_hash, cache_type, analysis)
         analysis['filename'] = filename
-
-        file_info = UserFile(
-            username=username,
-            filename=filename,
-            upload_date=datetime.now().isoformat(),
-            rows=analysis.get('total_rows', 0),
-            columns=analysis.get('total_columns', 0),
-            status='uploaded'
-        )
-        db.session.add(file_info)
+        # Le cache est partagé entre comptes : `cached` n'est signalé que pour un
+        # contenu que l'utilisateur a lui-même déjà envoyé, sans quoi il révélerait
+        # qu'un autre compte possède ce fichier
+        analysis['cached'] = cached and UserFile.query.filter_by(
+            username=username, content_hash=content_hash
+        ).first() is not None
+
+        # Ré-upload du même contenu sous le même nom : on rafraîchit l'entrée existante
+        file_info = UserFile.query.filter_by(
+            username=username, filename=filename, content_hash=content_hash
+        ).first()
+        if file_info:
+            file_info.upload_date = datetime.now().isoformat()
+            file_info.status = 'uploaded'
+        else:
+            file_info = UserFile(
+                username=username,
+                filename=filename,
+                upload_date=datetime.now().isoformat(),
+                rows=analysis.get('total_rows', 0),
+                columns=analysis.get('total_columns', 0),
+                status='uploaded',
+                content_hash=content_hash
+            )
+            update_user_stats(username, 1, file_info.rows)
+            db.session.add(file_info)
         db.session.commit()
         logger.info(f"Fichier enregistré pour {username}: {filename}")
 
@@ -279,6 +641,7 @@ def analyze_file():
 
 @app.route('/api/process', methods=['POST'])
 def process_file():
+    username = get_user_from_token() or 'anonymous'
     data = request.get_json(silent=True) or {}
     filename = data.get('filename', '').strip()
     raw_options = data.get('options', {})
@@ -291,7 +654,7 @@ def process_file():
     if safe_filename != filename:
         return jsonify({'error': 'Nom de fichier invalide'}), 400
 
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], safe_filename)
+    file_path = user_upload_path(username, safe_filename)
     if not os.path.exists(file_path):
         return jsonify({'error': 'Fichier non trouvé'}), 404
 
@@ -301,6 +664,7 @@ def process_file():
         return jsonify({'error': error}), 400
 
     file_type = get_file_type(safe_filename)
+    processor = get_processor()
 
     try:
         # Charger les données originales pour l'aperçu
@@ -313,7 +677,8 @@ def process_file():
         # Aperçu après traitement
         preview_after = processed_df.head(10).fillna('').to_dict('records')
 
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        # Microsecondes : deux traitements concurrents n'écrivent pas le même fichier
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
         output_format = options.get('output_format', 'csv')
         base_name = safe_filename.rsplit('.', 1)[0]
 
@@ -331,11 +696,8 @@ def process_file():
             processed_df.to_json(processed_path, orient='records')
 
         # Nettoyage automatique du fichier uploadé après traitement
-        try:
-            os.remove(file_path)
-            logger.info(f"Fichier temporaire supprimé : {safe_filename}")
-        except OSError as e:
-            logger.warning(f"Impossible de supprimer le fichier temporaire {safe_filename}: {e}")
+        release_upload(file_path, latest_upload_hash(username, safe_filename))
+        logger.info(f"Fichier temporaire supprimé : {safe_filename}")
 
         return jsonify({
             'message': 'Traitement terminé avec succès',
@@ -352,19 +714,378 @@ def process_file():
         return jsonify({'error': f"Erreur de traitement: {str(e)}"}), 500
 
 
+# ─── Requêtes sur les sorties traitées ───────────────────────────────────────
+
+def columnar_path(processed_filename):
+    return os.path.join(COLUMNAR_FOLDER, f"{processed_filename}.parquet")
+
+
+def ensure_columnar(processed_filename):
+    """Retourne la copie Parquet d'une sortie, (re)générée si absente ou plus ancienne.
+
+    La copie n'est créée qu'à la première requête et suit la sortie : elle est
+    supprimée dès que celle-ci n'existe plus.
+    """
+    from query_engine import write_columnar
+
+    source_path = os.path.join(app.config['PROCESSED_FOLDER'], processed_filename)
+    path = columnar_path(processed_filename)
+    if not os.path.isfile(source_path):
+        if os.path.exists(path):
+            os.remove(path)
+        return None
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(source_path):
+        df = get_processor().load_file(source_path, get_file_type(processed_filename))
+        write_columnar(df, path)
+        logger.info(f"Copie colonnaire générée : {processed_filename}")
+    return path
+
+
+def prune_columnar():
+    """Supprime les copies Parquet dont la sortie traitée a disparu."""
+    removed = 0
+    for name in os.listdir(COLUMNAR_FOLDER):
+        source_path = os.path.join(app.config['PROCESSED_FOLDER'], name[:-len('.parquet')])
+        if name.endswith('.parquet') and not os.path.isfile(source_path):
+            os.remove(os.path.join(COLUMNAR_FOLDER, name))
+            removed += 1
+    return removed
+
+
+@app.route('/api/query/<filename>', methods=['POST'])
+def query_processed_file(filename):
+    """Filtre, projection, group-by, tri et pagination côté serveur sur une sortie traitée.
+
+    Corps JSON : {columns, filters: [{column, op, value}], group_by,
+    aggregations: [{column, func}], sort: [{column, order}], limit, offset}.
+    """
+    from query_engine import run_query
+
+    username = get_user_from_token()
+    if not username:
+        return jsonify({'error': 'Non authentifié'}), 401
+
+    safe_filename = secure_filename(filename)
+    if safe_filename != filename or '.' not in safe_filename:
+        return jsonify({'error': 'Nom de fichier invalide'}), 400
+
+    try:
+        path = ensure_columnar(safe_filename)
+    except Exception as e:
+        logger.error(f"Erreur de conversion colonnaire pour {safe_filename}: {e}", exc_info=True)
+        return jsonify({'error': f"Erreur de lecture: {str(e)}"}), 500
+    if not path:
+        return jsonify({'error': 'Fichier non trouvé'}), 404
+
+    start = time.perf_counter()
+    try:
+        result = run_query(path, request.get_json(silent=True) or {})
+    except (ValueError, TypeError, NotImplementedError) as e:
+        return jsonify({'error': f"Requête invalide: {str(e)}"}), 400
+    except Exception as e:
+        logger.error(f"Erreur de requête sur {safe_filename}: {e}", exc_info=True)
+        return jsonify({'error': f"Erreur de requête: {str(e)}"}), 500
+
+    result['filename'] = safe_filename
+    result['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 2)
+    return jsonify(result)
+
+
+# ─── Datasets incrémentaux ────────────────────────────────────────────────────
+
+def dataset_paths(dataset):
+    directory = os.path.join(DATASET_FOLDER, str(dataset.id))
+    return (
+        directory,
+        os.path.join(directory, 'raw.csv'),
+        os.path.join(app.config['PROCESSED_FOLDER'], dataset.processed_filename)
+    )
+
+
+def load_uploaded_frame(username, filename):
+    """Charge un fichier déjà envoyé via /api/analyze. Retourne (df, chemin, erreur, code)."""
+    safe_filename = secure_filename(filename)
+    if not filename or safe_filename != filename:
+        return None, None, 'Nom de fichier invalide', 400
+    file_path = user_upload_path(username, safe_filename)
+    if not os.path.exists(file_path):
+        return None, None, 'Fichier non trouvé', 404
+    return get_processor().load_file(file_path, get_file_type(safe_filename)), file_path, None, None
+
+
+def link_user_file(username, filename, dataset_id, file_path):
+    file_info = UserFile.query.filter_by(username=username, filename=filename) \
+        .order_by(UserFile.id.desc()).first()
+    if file_info:
+        file_info.dataset_id = dataset_id
+        db.session.commit()
+    release_upload(file_path, file_info.content_hash if file_info else None)
+
+
+@app.route('/api/datasets', methods=['POST'])
+def create_dataset():
+    """Crée un dataset à partir d'un fichier uploadé et en fait le traitement complet."""
+    from incremental import save_state
+
+    username = get_user_from_token()
+    if not username:
+        return jsonify({'error': 'Non authentifié'}), 401
+
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename', '').strip()
+
+    options, error = validate_options(data.get('options', {}))
+    if error:
+        return jsonify({'error': error}), 400
+    if options['output_format'] != 'csv':
+        return jsonify({'error': 'Seul le format csv peut être prolongé par ajouts'}), 400
+
+    drift_threshold = data.get('drift_threshold')
+    if drift_threshold is not None and (
+        isinstance(drift_threshold, bool) or not isinstance(drift_threshold, (int, float))
+        or drift_threshold <= 0
+    ):
+        return jsonify({'error': 'drift_threshold doit être un nombre positif ou null.'}), 400
+
+    try:
+        df, file_path, error, code = load_uploaded_frame(username, filename)
+        if error:
+            return jsonify({'error': error}), code
+
+        processed_df, state, stats = get_incremental().fit(df, options)
+
+        dataset = Dataset(
+            username=username,
+            name=(data.get('name') or filename.rsplit('.', 1)[0])[:200],
+            options=json.dumps(options),
+            drift_threshold=drift_threshold,
+            total_rows=state['rows']
+        )
+        db.session.add(dataset)
+        db.session.flush()
+        dataset.processed_filename = f"{secure_filename(dataset.name) or 'dataset'}_dataset_{dataset.id}.csv"
+        db.session.commit()
+
+        directory, raw_path, processed_path = dataset_paths(dataset)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            processed_df.to_csv(processed_path, index=False)
+            # Historique brut conservé pour un éventuel réajustement complet ;
+            # écrit par renommage pour n'exister que complet
+            df.to_csv(f"{raw_path}.tmp", index=False)
+            os.replace(f"{raw_path}.tmp", raw_path)
+            state['version'] = dataset.version
+            state['raw_bytes'] = os.path.getsize(raw_path)
+            save_state(directory, state)
+        except Exception:
+            # Pas de dataset sans état : la ligne et les fichiers déjà écrits sont supprimés
+            shutil.rmtree(directory, ignore_errors=True)
+            if os.path.exists(processed_path):
+                os.remove(processed_path)
+            Dataset.query.filter_by(id=dataset.id).delete()
+            db.session.commit()
+            raise
+
+        link_user_file(username, filename, dataset.id, file_path)
+        logger.info(f"Dataset {dataset.id} créé pour {username}: {state['rows']} lignes")
+
+        return jsonify({
+            'dataset_id': dataset.id,
+            'processed_file': dataset.processed_filename,
+            'total_rows': dataset.total_rows,
+            'stats': stats
+        })
+    except Exception as e:
+        logger.error(f"Erreur de création du dataset pour {filename}: {e}", exc_info=True)
+        return jsonify({'error': f"Erreur de traitement: {str(e)}"}), 500
+
+
+# Au-delà, une réservation de version sans état correspondant est considérée
+# comme abandonnée (processus interrompu pendant un ajout)
+DATASET_CLAIM_TIMEOUT = int(os.environ.get('DATASET_CLAIM_TIMEOUT', 300))
+
+
+def truncate_file(path, size):
+    with open(path, 'r+b') as f:
+        f.truncate(size)
+
+
+@app.route('/api/datasets/<int:dataset_id>/append', methods=['POST'])
+def append_dataset(dataset_id):
+    """Traite uniquement les nouvelles lignes d'un fichier et prolonge la sortie du dataset.
+
+    Un réajustement complet (historique + nouvelles lignes) est fait si `refit`
+    est demandé ou si le décalage des moyennes dépasse le drift_threshold du dataset.
+
+    La version du dataset est réservée avant toute écriture et sert de verrou ;
+    state.json, écrit en dernier, valide l'ajout. En cas d'échec, les fichiers
+    sont ramenés à leur état précédent et la réservation est rendue. Un ajout
+    interrompu sans nettoyage (ou un état absent) est rattrapé par un
+    réajustement depuis raw.csv ; sans raw.csv, le dataset est signalé 410.
+    """
+    from incremental import load_state, save_state
+
+    username = get_user_from_token()
+    if not username:
+        return jsonify({'error': 'Non authentifié'}), 401
+
+    dataset = Dataset.query.filter_by(id=dataset_id, username=username).first()
+    if not dataset:
+        return jsonify({'error': 'Dataset non trouvé'}), 404
+
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename', '').strip()
+    options = json.loads(dataset.options)
+    directory, raw_path, processed_path = dataset_paths(dataset)
+
+    try:
+        df, file_path, error, code = load_uploaded_frame(username, filename)
+        if error:
+            return jsonify({'error': error}), code
+
+        version = dataset.version
+        try:
+            state = load_state(directory)
+        except FileNotFoundError:
+            # Création interrompue avant l'écriture de l'état : reconstruit depuis raw.csv
+            state = None
+        stale = state is None or state.get('version') != version
+        if stale:
+            if dataset.updated_at and \
+                    datetime.utcnow() - dataset.updated_at < timedelta(seconds=DATASET_CLAIM_TIMEOUT):
+                return jsonify({'error': 'Dataset en cours de mise à jour, réessayez'}), 409
+            if not os.path.exists(raw_path):
+                return jsonify({'error': 'Dataset incomplet (historique absent), recréez-le'}), 410
+            logger.warning(f"Dataset {dataset.id} : état obsolète ou absent, réajustement depuis raw.csv")
+
+        if state:
+            columns = state['columns']
+        else:
+            import pandas as pd
+            columns = list(pd.read_csv(raw_path, nrows=0).columns)
+        if set(df.columns) != set(columns):
+            return jsonify({'error': 'Les colonnes ne correspondent pas à celles du dataset'}), 400
+        df = df[columns]
+
+        incremental = get_incremental()
+        drift = incremental.drift(state, df) if state else {}
+        refit = stale or bool(data.get('refit')) or (
+            dataset.drift_threshold is not None
+            and any(score > dataset.drift_threshold for score in drift.values())
+        )
+
+        # Réservation de la version avant toute écriture : un ajout concurrent échoue ici
+        claimed = Dataset.query.filter_by(id=dataset.id, version=version).update({
+            Dataset.version: version + 1,
+            Dataset.updated_at: datetime.utcnow()
+        }, synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            return jsonify({'error': 'Dataset modifié en parallèle, réessayez'}), 409
+    except Exception as e:
+        logger.error(f"Erreur d'ajout au dataset {dataset_id}: {e}", exc_info=True)
+        return jsonify({'error': f"Erreur de traitement: {str(e)}"}), 500
+
+    backup_path = f"{processed_path}.bak"
+    raw_size = processed_size = None
+    replaced = False
+    try:
+        # Lignes d'un ajout interrompu : raw.csv est ramené à la taille connue de l'état
+        if stale and state and state.get('raw_bytes') is not None:
+            truncate_file(raw_path, state['raw_bytes'])
+        raw_size = os.path.getsize(raw_path)
+        if os.path.exists(processed_path):
+            processed_size = os.path.getsize(processed_path)
+
+        if refit:
+            history = get_processor().load_file(raw_path, 'csv')
+            processed_df, state, stats = incremental.refit(history, df, options)
+            tmp_path = f"{processed_path}.tmp"
+            processed_df.to_csv(tmp_path, index=False)
+        else:
+            processed_df, state, stats = incremental.append(df, state, options)
+
+        df.to_csv(raw_path, mode='a', header=False, index=False)
+        if refit:
+            if os.path.exists(backup_path):
+                os.remove(backup_path)
+            if processed_size is not None:
+                try:
+                    os.link(processed_path, backup_path)
+                except OSError:
+                    shutil.copyfile(processed_path, backup_path)
+            os.replace(tmp_path, processed_path)
+            replaced = True
+        else:
+            processed_df.to_csv(processed_path, mode='a', header=False, index=False)
+
+        state['version'] = version + 1
+        state['raw_bytes'] = os.path.getsize(raw_path)
+        save_state(directory, state)
+    except Exception as e:
+        logger.error(f"Erreur d'ajout au dataset {dataset_id}, annulation: {e}", exc_info=True)
+        try:
+            if raw_size is not None:
+                truncate_file(raw_path, raw_size)
+            if replaced and processed_size is None:
+                os.remove(processed_path)
+            elif replaced:
+                os.replace(backup_path, processed_path)
+            elif processed_size is not None:
+                truncate_file(processed_path, processed_size)
+            Dataset.query.filter_by(id=dataset.id, version=version + 1).update(
+                {Dataset.version: version}, synchronize_session=False
+            )
+            db.session.commit()
+        except Exception as undo_error:
+            # La réservation expirera après DATASET_CLAIM_TIMEOUT et déclenchera un réajustement
+            logger.error(f"Annulation impossible pour le dataset {dataset_id}: {undo_error}")
+        return jsonify({'error': f"Erreur de traitement: {str(e)}"}), 500
+    finally:
+        for path in (backup_path, f"{processed_path}.tmp"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    Dataset.query.filter_by(id=dataset.id).update({Dataset.total_rows: state['rows']},
+                                                  synchronize_session=False)
+    db.session.commit()
+    link_user_file(username, filename, dataset.id, file_path)
+    logger.info(f"Dataset {dataset.id} : {stats['final_rows']} lignes ajoutées ({stats['mode']})")
+
+    return jsonify({
+        'dataset_id': dataset.id,
+        'processed_file': dataset.processed_filename,
+        'total_rows': state['rows'],
+        'refit': refit,
+        'drift': drift,
+        'stats': stats
+    })
+
+
+FILES_PAGE_SIZE = 50
+FILES_PAGE_MAX = 200
+
+
 @app.route('/api/files', methods=['GET'])
 def get_user_files():
+    """Historique paginé par curseur : ?limit=N&before_id=<next_cursor précédent>."""
     username = get_user_from_token() or 'anonymous'
-    files = UserFile.query.filter_by(username=username).order_by(UserFile.id.desc()).all()
-    return jsonify({'files': [
-        {
-            'filename': f.filename,
-            'upload_date': f.upload_date,
-            'rows': f.rows,
-            'columns': f.columns,
-            'status': f.status
-        } for f in files
-    ]})
+    limit = request.args.get('limit', FILES_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, FILES_PAGE_MAX))
+    before_id = request.args.get('before_id', type=int)
+
+    query = UserFile.query.filter_by(username=username)
+    if before_id is not None:
+        query = query.filter(UserFile.id < before_id)
+    # Une ligne de plus pour savoir s'il reste une page suivante
+    files = query.order_by(UserFile.id.desc()).limit(limit + 1).all()
+    has_more = len(files) > limit
+    files = files[:limit]
+
+    return jsonify({
+        'files': [serialize_user_file(f) for f in files],
+        'next_cursor': files[-1].id if has_more else None
+    })
 
 
 @app.route('/api/files/<filename>', methods=['DELETE'])
@@ -372,11 +1093,16 @@ def delete_file(filename):
     username = get_user_from_token() or 'anonymous'
 
     safe_filename = secure_filename(filename)
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], safe_filename)
-    if os.path.exists(file_path):
-        os.remove(file_path)
-
-    UserFile.query.filter_by(username=username, filename=safe_filename).delete()
+    file_path = user_upload_path(username, safe_filename)
+    release_upload(file_path, latest_upload_hash(username, safe_filename))
+
+    matching = UserFile.query.filter_by(username=username, filename=safe_filename)
+    deleted_files, deleted_rows = db.session.query(
+        func.count(UserFile.id), func.coalesce(func.sum(UserFile.rows), 0)
+    ).filter(UserFile.username == username, UserFile.filename == safe_filename).one()
+    if deleted_files:
+        update_user_stats(username, -deleted_files, -deleted_rows)
+        matching.delete(synchronize_session=False)
     db.session.commit()
 
     return jsonify({'success': True})
@@ -389,15 +1115,18 @@ def preview_file(filename):
         return jsonify({'error': 'Non authentifié'}), 401
 
     safe_filename = secure_filename(filename)
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], safe_filename)
+    file_path = user_upload_path(username, safe_filename)
     if not os.path.exists(file_path):
         return jsonify({'error': 'Fichier non trouvé'}), 404
 
     file_type = get_file_type(safe_filename)
+    processor = get_processor()
 
     try:
         df = processor.load_file(file_path, file_type)
-        preview_data = df.head(10).to_dict('records')
+        head = df.head(10)
+        # NaN / pd.NA (colonnes Arrow) ne sont pas sérialisables en JSON : null
+        preview_data = head.astype(object).where(head.notna(), None).to_dict('records')
         columns = df.columns.tolist()
         return jsonify({'columns': columns, 'data': preview_data})
     except Exception as e:
@@ -408,23 +1137,13 @@ def preview_file(filename):
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     username = get_user_from_token() or 'anonymous'
-    files = UserFile.query.filter_by(username=username).all()
-    total_files = len(files)
-    total_rows = sum(f.rows for f in files)
+    total_files, total_rows = get_user_stats(username)
     recent = UserFile.query.filter_by(username=username).order_by(UserFile.id.desc()).limit(5).all()
 
     return jsonify({
         'total_files': total_files,
         'total_rows': total_rows,
-        'recent_files': [
-            {
-                'filename': f.filename,
-                'upload_date': f.upload_date,
-                'rows': f.rows,
-                'columns': f.columns,
-                'status': f.status
-            } for f in recent
-        ]
+        'recent_files': [serialize_user_file(f) for f in recent]
     })
 
 
@@ -454,5 +1173,6 @@ def serve(path):
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
+    init_db()
     logger.info(f"Démarrage du serveur sur le port {port}")
     app.run(host='0.0.0.0', port=port, debug=False)
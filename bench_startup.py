@@ -0,0 +1,55 @@
+"""Mesure le temps de démarrage à froid de l'application.
+
+Chaque essai lance un interpréteur neuf qui importe `app` puis sert une
+première requête /api/status ; on rapporte médiane et minimum, ainsi que
+les bibliothèques lourdes déjà chargées après l'import.
+
+Usage : python bench_startup.py [nombre_d_essais]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HEAVY_MODULES = ['pandas', 'numpy', 'sklearn', 'openpyxl', 'lxml']
+
+PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+app.app.test_client().get('/api/status')
+t2 = time.perf_counter()
+print(json.dumps({
+    'import_ms': (t1 - t0) * 1000,
+    'first_request_ms': (t2 - t1) * 1000,
+    'heavy_loaded': [m for m in %r if m in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def run_once(workdir):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    env['PYTHONPATH'] = os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE], cwd=workdir, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    with tempfile.TemporaryDirectory() as workdir:
+        results = [run_once(workdir) for _ in range(runs)]
+
+    for key in ('import_ms', 'first_request_ms'):
+        values = [r[key] for r in results]
+        print(f"{key:18s} médiane {statistics.median(values):8.1f}  min {min(values):8.1f}")
+    print(f"modules lourds chargés à l'import : {results[-1]['heavy_loaded'] or 'aucun'}")
+
+
+if __name__ == '__main__':
+    main()
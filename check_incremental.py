@@ -0,0 +1,117 @@
+"""Vérifie le traitement incrémental (incremental.py) sur des données synthétiques.
+
+Contrôle que fit() produit la même sortie que DataProcessor.process_data,
+qu'append() écarte les lignes déjà traitées, et que l'état survit à un
+aller-retour save_state / load_state.
+
+Usage : python check_incremental.py [nombre_de_lignes]
+"""
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from data_processor import DataProcessor
+from incremental import IncrementalProcessor, load_state, save_state
+
+OPTIONS = {
+    'missing_strategy': 'mean',
+    'outlier_method': 'iqr',
+    'outlier_action': 'cap',
+    'duplicate_subset': None,
+    'normalization': 'standard',
+    'output_format': 'csv'
+}
+
+
+def build_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'id': np.arange(rows),
+        'valeur': rng.normal(10, 2, size=rows),
+        'ville': rng.choice(['Paris', 'Lyon', 'Nice', None], rows),
+        'actif': rng.choice(['yes', 'no'], rows)
+    })
+    df.loc[::13, 'valeur'] = np.nan
+    df.loc[::500, 'valeur'] = 1000
+    return df
+
+
+def assert_frames_equal(left, right):
+    assert list(left.columns) == list(right.columns), (list(left.columns), list(right.columns))
+    assert len(left) == len(right), (len(left), len(right))
+    for col in left.columns:
+        a, b = left[col].reset_index(drop=True), right[col].reset_index(drop=True)
+        if pd.api.types.is_numeric_dtype(a) and pd.api.types.is_numeric_dtype(b):
+            assert np.allclose(a.to_numpy(float), b.to_numpy(float), equal_nan=True), col
+        else:
+            assert a.astype(str).equals(b.astype(str)), col
+
+
+def check_fit_matches_process_data(processor, incremental, df, workdir):
+    path = os.path.join(workdir, 'complet.csv')
+    df.to_csv(path, index=False)
+
+    expected, expected_stats = processor.process_data(path, 'csv', OPTIONS)
+    processed, _, stats = incremental.fit(processor.load_file(path, 'csv'), OPTIONS, seed=0)
+
+    assert_frames_equal(processed, expected)
+    assert stats == dict(expected_stats, mode='full'), (stats, expected_stats)
+    print(f"OK  fit == process_data ({len(processed)} lignes)")
+
+
+def check_append_deduplicates(incremental, df):
+    split = len(df) * 3 // 4
+    base, fresh = df.iloc[:split], df.iloc[split:]
+    _, state, _ = incremental.fit(base.copy(), OPTIONS, seed=0)
+
+    # Lignes complètes et hors valeurs extrêmes : identiques une fois traitées
+    complete = base.dropna()
+    repeated = complete[complete['valeur'].between(9, 11)].head(20)
+    batch = pd.concat([fresh, repeated], ignore_index=True)
+    processed, state, stats = incremental.append(batch, state, OPTIONS, seed=1)
+
+    assert stats['mode'] == 'append'
+    assert stats['duplicates_removed'] >= len(repeated), stats
+    assert not processed['id'].isin(repeated['id']).any(), "lignes déjà traitées ré-émises"
+    assert len(processed) == len(fresh), (len(processed), len(fresh))
+    assert state['rows'] == split + len(fresh), state['rows']
+    print(f"OK  append écarte {len(repeated)} lignes déjà vues, garde {len(processed)} nouvelles")
+    return state
+
+
+def check_state_round_trip(state, workdir):
+    directory = os.path.join(workdir, 'etat')
+    state['version'] = 3
+    save_state(directory, state)
+    save_state(directory, state)
+    loaded = load_state(directory)
+
+    assert np.array_equal(loaded['hashes'], state['hashes'])
+    assert loaded['samples'].keys() == state['samples'].keys()
+    for col, sample in state['samples'].items():
+        assert np.array_equal(loaded['samples'][col], sample), col
+    for key in ('columns', 'column_kinds', 'options', 'rows', 'numeric', 'categorical', 'scaling', 'version'):
+        assert loaded[key] == state[key], key
+
+    arrays = [name for name in os.listdir(directory) if name.endswith('.npz')]
+    assert len(arrays) <= 2, arrays
+    print(f"OK  état relu à l'identique ({len(state['hashes'])} empreintes, {len(arrays)} fichiers de tableaux)")
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    processor = DataProcessor()
+    incremental = IncrementalProcessor(processor)
+    df = build_frame(rows)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        check_fit_matches_process_data(processor, incremental, df, workdir)
+        state = check_append_deduplicates(incremental, df)
+        check_state_round_trip(state, workdir)
+
+
+if __name__ == '__main__':
+    main()
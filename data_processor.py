@@ -1,22 +1,86 @@
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler, MinMaxScaler
 import json
+import math
 import xml.etree.ElementTree as ET
 from datetime import datetime
 import logging
+from sketches import ReservoirSample, HyperLogLog
 
 logger = logging.getLogger(__name__)
 
 
 class DataProcessor:
-    def __init__(self):
-        self.scaler = StandardScaler()
-        self.analysis_results = {}
-        self.processing_stats = {}
+    """Moteur de chargement, d'analyse et de nettoyage des données.
+
+    Sans état : aucune méthode ne modifie l'instance ni les DataFrames reçus
+    (chacune travaille sur une copie et retourne son résultat). Une même
+    instance peut donc être partagée entre threads et requêtes concurrentes ;
+    seule la configuration (moteur CSV) est fixée à la construction.
+
+    csv_engine='arrow' lit les CSV avec pyarrow (fichier mappé en mémoire,
+    analyse multi-thread, chaînes en string[pyarrow]) ; repli sur pandas si
+    pyarrow est absent ou si le fichier n'est pas lisible ainsi.
+    """
+
+    CSV_ENGINES = ('pandas', 'arrow')
+
+    def __init__(self, csv_engine='pandas'):
+        if csv_engine not in self.CSV_ENGINES:
+            raise ValueError(f"csv_engine invalide : {csv_engine}. Valeurs acceptées : {self.CSV_ENGINES}")
+        self.csv_engine = csv_engine
+
+    def _load_csv_arrow(self, file_path):
+        """Lecture pyarrow du CSV mappé en mémoire. Retourne None si impossible."""
+        try:
+            import pyarrow as pa
+            import pyarrow.csv as pa_csv
+        except ImportError:
+            logger.warning("pyarrow non installé, lecture CSV avec pandas")
+            return None
+
+        parse_options = pa_csv.ParseOptions(invalid_row_handler=lambda row: 'skip')
+        try:
+            # Les dates restent du texte comme avec pd.read_csv : on relit le
+            # schéma inféré sur le premier bloc pour forcer ces colonnes en string
+            with pa.memory_map(file_path, 'r') as source:
+                schema = pa_csv.open_csv(source, parse_options=parse_options).schema
+            temporal = {
+                field.name: pa.string() for field in schema
+                if pa.types.is_temporal(field.type)
+            }
+            with pa.memory_map(file_path, 'r') as source:
+                table = pa_csv.read_csv(
+                    source,
+                    read_options=pa_csv.ReadOptions(use_threads=True),
+                    parse_options=parse_options,
+                    # strings_can_be_null : 'NA', 'null', '' deviennent manquants comme avec pandas
+                    convert_options=pa_csv.ConvertOptions(
+                        column_types=temporal, strings_can_be_null=True
+                    )
+                )
+        except (pa.ArrowException, OSError) as e:
+            logger.warning(f"Lecture Arrow impossible ({e}), repli sur pandas")
+            return None
+
+        # Colonnes binaires : texte non UTF-8, pandas gère les autres encodages
+        if any(pa.types.is_binary(t) or pa.types.is_large_binary(t) for t in table.schema.types):
+            logger.warning("CSV non UTF-8, repli sur pandas")
+            return None
+
+        string_dtype = pd.StringDtype('pyarrow')
+        return table.to_pandas(types_mapper={
+            pa.string(): string_dtype,
+            pa.large_string(): string_dtype
+        }.get)
 
     def load_file(self, file_path, file_type):
         try:
+            if file_type == 'csv' and self.csv_engine == 'arrow':
+                df = self._load_csv_arrow(file_path)
+                if df is not None:
+                    return df
+
             if file_type == 'csv':
                 encodings = ['utf-8', 'latin-1', 'iso-8859-1', 'cp1252']
 
@@ -197,10 +261,187 @@ class DataProcessor:
 
         return analysis
 
-    def handle_missing_values(self, df, strategy='mean'):
+    def iter_chunks(self, file_path, file_type, chunksize=50000):
+        """Lit le fichier par blocs (CSV uniquement) ; les autres formats sont chargés en entier.
+
+        Le repli sur un chargement complet n'a lieu que si l'erreur survient
+        avant le premier bloc : ensuite, des lignes seraient comptées deux fois.
+        """
+        if file_type == 'csv':
+            started = False
+            try:
+                reader = pd.read_csv(
+                    file_path, encoding='utf-8', encoding_errors='replace',
+                    sep=',', on_bad_lines='skip', chunksize=chunksize
+                )
+                for chunk in reader:
+                    started = True
+                    yield chunk
+                return
+            except pd.errors.ParserError as e:
+                if started:
+                    logger.error(f"Lecture par blocs interrompue : {e}")
+                    raise
+                logger.warning(f"Lecture par blocs impossible ({e}), chargement complet")
+        yield self.load_file(file_path, file_type)
+
+    @staticmethod
+    def _merge_dtypes(current, dtype):
+        """Type commun de deux blocs d'une même colonne, comme pandas sur le fichier entier.
+
+        Deux types numériques se combinent (int64 + float64 → float64, quand des NaN
+        n'apparaissent que dans un bloc) ; un mélange numérique / texte donne object.
+        """
+        if current == dtype:
+            return current
+        numeric = [
+            isinstance(t, np.dtype) and pd.api.types.is_numeric_dtype(t) and not pd.api.types.is_bool_dtype(t)
+            for t in (current, dtype)
+        ]
+        if all(numeric):
+            return np.result_type(current, dtype)
+        return np.dtype(object)
+
+    def analyze_data_approx(self, chunks, sample_size=10000, hll_precision=14, seed=None):
+        """Analyse approximative en un seul passage et en mémoire constante.
+
+        `chunks` est un DataFrame ou un itérable de DataFrames. Les valeurs manquantes
+        restent exactes ; les bornes IQR viennent d'un échantillon réservoir par colonne
+        et les doublons d'une estimation HyperLogLog des lignes distinctes. Les marges
+        d'erreur (~95 %) sont renvoyées dans 'error_bounds'.
+        """
+        if isinstance(chunks, pd.DataFrame):
+            chunks = [chunks]
+
+        rng = np.random.default_rng(seed)
+        hll = HyperLogLog(hll_precision)
+        reservoirs = {}
+        non_null = {}
+        missing = {}
+        dtypes = {}
+        columns = []
+        total_rows = 0
+        hashing_failed = False
+
+        for chunk in chunks:
+            if not columns:
+                columns = [str(col) for col in chunk.columns]
+            total_rows += len(chunk)
+
+            for col, count in chunk.isnull().sum().items():
+                missing[str(col)] = missing.get(str(col), 0) + int(count)
+            for col, dtype in chunk.dtypes.items():
+                current = dtypes.get(str(col))
+                dtypes[str(col)] = dtype if current is None else self._merge_dtypes(current, dtype)
+
+            if not hashing_failed:
+                try:
+                    hll.update_frame(chunk)
+                except TypeError as e:
+                    logger.warning(f"Impossible de hacher les lignes pour les doublons: {e}")
+                    hashing_failed = True
+
+            for col in chunk.select_dtypes(include=[np.number]).columns:
+                col_data = chunk[col].dropna().to_numpy()
+                if str(col) not in reservoirs:
+                    reservoirs[str(col)] = ReservoirSample(sample_size, rng)
+                    non_null[str(col)] = 0
+                reservoirs[str(col)].update(col_data)
+                non_null[str(col)] += len(col_data)
+
+        column_types = {col: str(dtype) for col, dtype in dtypes.items()}
+        if hashing_failed:
+            distinct, duplicates_margin = total_rows, 0
+        else:
+            distinct = min(hll.estimate(), total_rows)
+            duplicates_margin = 2 * hll.relative_error() * distinct
+        analysis = {
+            'total_rows': total_rows,
+            'total_columns': len(columns),
+            'missing_values': {col: count for col, count in missing.items() if count > 0},
+            'duplicates': int(round(total_rows - distinct)),
+            'outliers': {},
+            'column_types': column_types,
+            'approximate': True,
+            'error_bounds': {
+                'duplicates': int(math.ceil(duplicates_margin)),
+                'quantile_rank_error': 0.0,
+                'outliers': {}
+            }
+        }
+
+        for col, reservoir in reservoirs.items():
+            if not pd.api.types.is_numeric_dtype(dtypes[col]) or reservoir.filled == 0:
+                continue
+            sample = reservoir.sample()
+            Q1 = reservoir.quantile(0.25)
+            Q3 = reservoir.quantile(0.75)
+            IQR = Q3 - Q1
+            if IQR <= 0:
+                continue
+            lower = Q1 - 1.5 * IQR
+            upper = Q3 + 1.5 * IQR
+            ratio = float(((sample < lower) | (sample > upper)).mean())
+            estimate = int(round(ratio * non_null[col]))
+            if estimate > 0:
+                analysis['outliers'][col] = estimate
+                if reservoir.filled < reservoir.seen:
+                    margin = 1.96 * math.sqrt(ratio * (1 - ratio) / reservoir.filled) * non_null[col]
+                    analysis['error_bounds']['outliers'][col] = int(math.ceil(margin))
+            analysis['error_bounds']['quantile_rank_error'] = max(
+                analysis['error_bounds']['quantile_rank_error'], round(reservoir.rank_error(), 6)
+            )
+
+        return analysis
+
+    def clean_values(self, df, column_kinds=None):
+        """Remplace les valeurs invalides par NaN et convertit les colonnes numériques.
+
+        Sans `column_kinds`, les colonnes numériques et oui/non sont détectées sur
+        df ; sinon les décisions fournies sont réappliquées telles quelles (mode
+        incrémental). Retourne (df, column_kinds).
+        """
+        df = df.copy()
+        invalid_values = ['--', 'NA', 'na', 'n/a', 'NaN', 'nan',
+                          'N/A', 'none', 'None', 'NULL', 'null', '?', ' ']
+        df.replace(invalid_values, np.nan, inplace=True)
+        valid_vals = {'Y', 'N', 'y', 'n', 'YES', 'NO', 'yes', 'no'}
+
+        if column_kinds is None:
+            column_kinds = {'numeric': [], 'yes_no': []}
+            for col in df.columns:
+                converted = pd.to_numeric(df[col], errors='coerce')
+                if converted.notna().sum() / len(df) > 0.5:
+                    df[col] = converted
+                    column_kinds['numeric'].append(col)
+
+            for col in df.select_dtypes(include=['object', 'string']).columns:
+                unique_vals = set(df[col].dropna().unique())
+                if unique_vals & valid_vals:
+                    column_kinds['yes_no'].append(col)
+        else:
+            for col in column_kinds['numeric']:
+                df[col] = pd.to_numeric(df[col], errors='coerce')
+
+        for col in column_kinds['yes_no']:
+            df[col] = df[col].apply(
+                lambda x: x if x in valid_vals else np.nan
+            )
+
+        return df, column_kinds
+
+    def handle_missing_values(self, df, strategy='mean', fill_values=None):
+        """Impute les valeurs manquantes ; `fill_values` ({colonne: valeur}) remplace le calcul sur df."""
         df = df.copy()
         missing_details = {}
 
+        if fill_values is not None:
+            for col, fill_value in fill_values.items():
+                if col in df.columns and df[col].isnull().any():
+                    missing_details[col] = int(df[col].isnull().sum())
+                    df[col] = df[col].fillna(fill_value)
+            return df, missing_details
+
         numeric_cols = df.select_dtypes(include=[np.number]).columns
         for col in numeric_cols:
             if df[col].isnull().any():
@@ -216,7 +457,7 @@ class DataProcessor:
                 df[col] = df[col].fillna(fill_value)
                 missing_details[col] = missing_count
 
-        categorical_cols = df.select_dtypes(include=['object']).columns
+        categorical_cols = df.select_dtypes(include=['object', 'string']).columns
         for col in categorical_cols:
             if df[col].isnull().any():
                 missing_count = int(df[col].isnull().sum())
@@ -227,9 +468,14 @@ class DataProcessor:
 
         return df, missing_details
 
-    def handle_outliers(self, df, method='iqr', action='cap'):
+    def handle_outliers(self, df, method='iqr', action='cap', bounds=None):
+        """Traite les outliers ; `bounds` ({colonne: (Q1, Q3)} pour iqr, (moyenne, écart-type)
+        pour zscore) remplace les statistiques calculées sur df."""
+        df = df.copy()
         outlier_details = {}
         numeric_cols = df.select_dtypes(include=[np.number]).columns
+        if bounds is not None:
+            numeric_cols = [col for col in numeric_cols if col in bounds]
 
         for col in numeric_cols:
             col_data = df[col].dropna()
@@ -238,8 +484,11 @@ class DataProcessor:
 
             try:
                 if method == 'iqr':
-                    Q1 = col_data.quantile(0.25)
-                    Q3 = col_data.quantile(0.75)
+                    if bounds is not None:
+                        Q1, Q3 = bounds[col]
+                    else:
+                        Q1 = col_data.quantile(0.25)
+                        Q3 = col_data.quantile(0.75)
                     IQR = Q3 - Q1
                     if IQR > 0:
                         lower = Q1 - 1.5 * IQR
@@ -256,8 +505,11 @@ class DataProcessor:
                                 df = df[~outliers_mask]
 
                 elif method == 'zscore':
-                    mean = col_data.mean()
-                    std = col_data.std()
+                    if bounds is not None:
+                        mean, std = bounds[col]
+                    else:
+                        mean = col_data.mean()
+                        std = col_data.std()
                     if std > 0:
                         z_scores = np.abs((df[col] - mean) / std)
                         outliers_mask = z_scores > 3
@@ -284,16 +536,27 @@ class DataProcessor:
         duplicates_removed = initial_count - len(df)
         return df, duplicates_removed
 
-    def normalize_data(self, df, method='standard'):
+    def normalize_data(self, df, method='standard', params=None):
+        """Normalise les colonnes numériques ; `params` ({colonne: (centre, échelle)})
+        applique (x - centre) / échelle au lieu d'ajuster un scaler sur df."""
         numeric_cols = df.select_dtypes(include=[np.number]).columns
         if len(numeric_cols) > 0 and len(df) > 0:
+            if method not in ('standard', 'minmax'):
+                return df
+            if params is not None:
+                df = df.copy()
+                for col, (center, scale) in params.items():
+                    if col in df.columns:
+                        df[col] = (df[col] - center) / scale
+                return df
             try:
+                # Import paresseux : scikit-learn n'est chargé que si une normalisation est demandée
+                from sklearn.preprocessing import StandardScaler, MinMaxScaler
                 if method == 'standard':
                     scaler = StandardScaler()
-                elif method == 'minmax':
-                    scaler = MinMaxScaler()
                 else:
-                    return df
+                    scaler = MinMaxScaler()
+                df = df.copy()
                 df[numeric_cols] = scaler.fit_transform(df[numeric_cols])
             except (ValueError, TypeError) as e:
                 logger.warning(f"Erreur lors de la normalisation: {e}")
@@ -315,23 +578,7 @@ class DataProcessor:
         initial_rows = len(df)
         logger.info(f"Fichier chargé: {initial_rows} lignes, {len(df.columns)} colonnes")
 
-        invalid_values = ['--', 'NA', 'na', 'n/a', 'NaN', 'nan', 
-                          'N/A', 'none', 'None', 'NULL', 'null', '?', ' ']
-        df.replace(invalid_values, np.nan, inplace=True)
-
-        for col in df.columns:
-            converted = pd.to_numeric(df[col], errors='coerce')
-            if converted.notna().sum() / len(df) > 0.5:
-                df[col] = converted
-
-        for col in df.select_dtypes(include='object').columns:
-            unique_vals = set(df[col].dropna().unique())
-            valid_vals = {'Y', 'N', 'y', 'n', 'YES', 'NO', 'yes', 'no'}
-            
-            if unique_vals & valid_vals:
-                df[col] = df[col].apply(
-                    lambda x: x if x in valid_vals else np.nan
-                )
+        df, _ = self.clean_values(df)
 
         logger.info("Valeurs invalides remplacées par NaN")
 
@@ -0,0 +1,30 @@
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+
+# Workers multi-threads : les uploads et lectures disque se recouvrent au sein
+# d'un même processus (DataProcessor est sans état et partageable entre threads,
+# les sessions Flask-SQLAlchemy sont propres à chaque thread).
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# L'application est importée une seule fois dans le maître puis forkée :
+# les workers partagent le code et les bibliothèques en copy-on-write.
+preload_app = True
+
+
+def when_ready(server):
+    from app import warm_up
+    warm_up()
+    # Sort les objets déjà alloués du suivi du GC pour éviter qu'il ne touche
+    # (et donc ne copie) les pages partagées dans les workers.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Les connexions SQLAlchemy ne doivent pas être partagées entre processus
+    from app import app, db
+    with app.app_context():
+        db.engine.dispose()
@@ -0,0 +1,266 @@
+import json
+import os
+import uuid
+import numpy as np
+import pandas as pd
+from sketches import ReservoirSample, row_hashes
+
+
+class IncrementalProcessor:
+    """Traitement incrémental d'un dataset qui grossit par ajout de lignes.
+
+    fit() traite un jeu complet comme process_data et en extrait un état :
+    statistiques courantes par colonne (comptes, sommes, échantillon réservoir
+    pour médiane/quartiles, fréquences des modalités), paramètres de
+    normalisation figés et empreintes des lignes déjà conservées. append() ne
+    traite que les nouvelles lignes avec cet état, de sorte que la sortie
+    existante est prolongée sans être réécrite. Comme DataProcessor, la classe
+    est sans état : l'état du dataset est passé et retourné explicitement.
+    """
+
+    SAMPLE_SIZE = 10000
+    MAX_CATEGORIES = 1000
+
+    def __init__(self, processor):
+        self.processor = processor
+
+    # ─── Statistiques courantes ─────────────────────────────────────────────
+
+    def _empty_state(self, df, column_kinds, options):
+        return {
+            'columns': list(df.columns),
+            'column_kinds': column_kinds,
+            'options': options,
+            'rows': 0,
+            'numeric': {},
+            'categorical': {},
+            'scaling': {},
+            'samples': {},
+            'hashes': np.empty(0, dtype=np.uint64)
+        }
+
+    def _update_running(self, state, df, rng):
+        """Ajoute les valeurs non manquantes de df aux statistiques courantes."""
+        for col in df.select_dtypes(include=[np.number]).columns:
+            values = df[col].dropna().to_numpy(dtype=np.float64)
+            stats = state['numeric'].setdefault(col, {'count': 0, 'sum': 0.0, 'sumsq': 0.0})
+            stats['count'] += len(values)
+            stats['sum'] += float(values.sum())
+            stats['sumsq'] += float(np.square(values).sum())
+
+            reservoir = ReservoirSample(self.SAMPLE_SIZE, rng)
+            sample = state['samples'].get(col)
+            if sample is not None:
+                reservoir.values[:len(sample)] = sample
+                reservoir.filled = len(sample)
+                reservoir.seen = stats.get('seen', len(sample))
+            reservoir.update(values)
+            state['samples'][col] = reservoir.sample().copy()
+            stats['seen'] = reservoir.seen
+
+        for col in df.select_dtypes(include=['object', 'string']).columns:
+            counts = state['categorical'].setdefault(col, {})
+            for value, count in df[col].dropna().astype(str).value_counts().items():
+                counts[value] = counts.get(value, 0) + int(count)
+            # Seules les modalités les plus fréquentes servent au mode : on borne la mémoire
+            if len(counts) > self.MAX_CATEGORIES:
+                top = sorted(counts.items(), key=lambda item: item[1], reverse=True)
+                state['categorical'][col] = dict(top[:self.MAX_CATEGORIES])
+
+    @staticmethod
+    def _mean_std(stats):
+        count = stats['count']
+        if count == 0:
+            return 0.0, 0.0
+        mean = stats['sum'] / count
+        if count < 2:
+            return mean, 0.0
+        variance = max(stats['sumsq'] - count * mean * mean, 0.0) / (count - 1)
+        return mean, float(np.sqrt(variance))
+
+    def _fill_values(self, state, strategy):
+        fill_values = {}
+        for col, stats in state['numeric'].items():
+            if strategy == 'mean':
+                fill_values[col] = self._mean_std(stats)[0]
+            elif strategy == 'median':
+                sample = state['samples'].get(col)
+                fill_values[col] = float(np.median(sample)) if sample is not None and len(sample) else 0
+            else:  # zero
+                fill_values[col] = 0
+        for col, counts in state['categorical'].items():
+            fill_values[col] = max(counts, key=counts.get) if counts else 'Unknown'
+        return fill_values
+
+    def _outlier_bounds(self, state, method):
+        bounds = {}
+        for col, stats in state['numeric'].items():
+            if method == 'iqr':
+                sample = state['samples'].get(col)
+                if sample is not None and len(sample):
+                    bounds[col] = (float(np.quantile(sample, 0.25)), float(np.quantile(sample, 0.75)))
+            else:
+                bounds[col] = self._mean_std(stats)
+        return bounds
+
+    @staticmethod
+    def _scaling(df, method):
+        """Paramètres (centre, échelle) équivalents à StandardScaler / MinMaxScaler."""
+        params = {}
+        for col in df.select_dtypes(include=[np.number]).columns:
+            values = df[col].to_numpy(dtype=np.float64)
+            if len(values) == 0:
+                continue
+            if method == 'standard':
+                center, scale = float(np.nanmean(values)), float(np.nanstd(values))
+            else:
+                center, scale = float(np.nanmin(values)), float(np.nanmax(values) - np.nanmin(values))
+            params[col] = (center, scale if scale > 0 else 1.0)
+        return params
+
+    @staticmethod
+    def row_hashes(df, subset=None):
+        """Empreinte 64 bits par ligne, indépendante du dtype (voir sketches.row_hashes)."""
+        return row_hashes(df, subset)
+
+    # ─── Traitement ──────────────────────────────────────────────────────────
+
+    def drift(self, state, df):
+        """Décalage de la moyenne des nouvelles lignes, en écarts-types de la référence."""
+        cleaned, _ = self.processor.clean_values(df, state['column_kinds'])
+        scores = {}
+        for col, stats in state['numeric'].items():
+            reference_mean, reference_std = stats.get('fit_mean'), stats.get('fit_std')
+            values = cleaned[col].dropna() if col in cleaned.columns else []
+            if reference_std and len(values) > 0:
+                scores[col] = round(abs(float(values.mean()) - reference_mean) / reference_std, 4)
+        return scores
+
+    def fit(self, df, options, seed=None):
+        """Traitement complet de df. Retourne (df_traité, état, stats)."""
+        p = self.processor
+        rng = np.random.default_rng(seed)
+        initial_rows = len(df)
+        cleaned, column_kinds = p.clean_values(df)
+        state = self._empty_state(cleaned, column_kinds, options)
+        self._update_running(state, cleaned, rng)
+        for col, stats in state['numeric'].items():
+            stats['fit_mean'], stats['fit_std'] = self._mean_std(stats)
+
+        processed, stats = self._run(cleaned, options, initial_rows, state, fitted=False)
+        stats['mode'] = 'full'
+        return processed, state, stats
+
+    def append(self, df, state, options, seed=None):
+        """Traite uniquement les nouvelles lignes avec l'état existant.
+
+        Retourne (lignes_traitées_à_ajouter, nouvel_état, stats).
+        """
+        p = self.processor
+        rng = np.random.default_rng(seed)
+        initial_rows = len(df)
+        df = df[state['columns']]
+        cleaned, _ = p.clean_values(df, state['column_kinds'])
+        self._update_running(state, cleaned, rng)
+
+        processed, stats = self._run(cleaned, options, initial_rows, state, fitted=True)
+        stats['mode'] = 'append'
+        return processed, state, stats
+
+    def refit(self, history, df, options, seed=None):
+        """Réajustement complet sur l'historique brut et les nouvelles lignes."""
+        combined = pd.concat([history, df[list(history.columns)]], ignore_index=True)
+        return self.fit(combined, options, seed)
+
+    def _run(self, cleaned, options, initial_rows, state, fitted):
+        p = self.processor
+        strategy = options.get('missing_strategy', 'mean')
+        method = options.get('outlier_method', 'iqr')
+        subset = options.get('duplicate_subset')
+        normalization = options.get('normalization', 'standard')
+
+        stats = {
+            'initial_rows': initial_rows,
+            'initial_columns': len(cleaned.columns),
+            'normalization_method': normalization
+        }
+
+        df, stats['missing_values'] = p.handle_missing_values(
+            cleaned, strategy, self._fill_values(state, strategy) if fitted else None
+        )
+        df, stats['outliers'] = p.handle_outliers(
+            df, method, options.get('outlier_action', 'cap'),
+            self._outlier_bounds(state, method) if fitted else None
+        )
+
+        duplicates_found = int(df.duplicated().sum())
+        df, duplicates_removed = p.remove_duplicates(df, subset)
+        # Doublons avec les lignes des traitements précédents
+        hashes = self.row_hashes(df, subset)
+        if fitted and len(df):
+            seen = np.isin(hashes, state['hashes'])
+            duplicates_found += int(seen.sum())
+            duplicates_removed += int(seen.sum())
+            df, hashes = df[~seen], hashes[~seen]
+        state['hashes'] = np.union1d(state['hashes'], hashes)
+        stats['duplicates_found'] = duplicates_found
+        stats['duplicates_removed'] = duplicates_removed
+
+        if not fitted:
+            state['scaling'] = self._scaling(df, normalization) if normalization != 'none' else {}
+        df = p.normalize_data(df, normalization, state['scaling'])
+
+        state['rows'] += len(df)
+        stats['final_rows'] = len(df)
+        stats['final_columns'] = len(df.columns)
+        stats['rows_removed'] = initial_rows - len(df)
+        return df, stats
+
+
+# ─── Persistance de l'état ────────────────────────────────────────────────────
+
+def save_state(directory, state):
+    """Écrit l'état par fichiers temporaires renommés atomiquement.
+
+    Les tableaux NumPy vont dans un fichier au nom unique que state.json
+    référence : le renommage de state.json valide l'ensemble, un échec avant
+    lui laisse l'état précédent intact.
+    """
+    os.makedirs(directory, exist_ok=True)
+    payload = {key: value for key, value in state.items() if key not in ('samples', 'hashes')}
+    payload['scaling'] = {col: list(params) for col, params in state['scaling'].items()}
+    payload['arrays'] = f"arrays_{uuid.uuid4().hex}.npz"
+
+    tmp = os.path.join(directory, 'arrays.tmp.npz')
+    np.savez(tmp, hashes=state['hashes'],
+             **{f'sample_{i}': state['samples'][col] for i, col in enumerate(payload['numeric'])})
+    os.replace(tmp, os.path.join(directory, payload['arrays']))
+
+    state_path = os.path.join(directory, 'state.json')
+    previous = None
+    if os.path.exists(state_path):
+        with open(state_path, encoding='utf-8') as f:
+            previous = json.load(f).get('arrays')
+
+    tmp = os.path.join(directory, 'state.json.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(payload, f)
+    os.replace(tmp, state_path)
+
+    # Les tableaux précédents restent lisibles pour un lecteur qui vient de lire l'ancien state.json
+    for name in os.listdir(directory):
+        if name.startswith('arrays') and name.endswith('.npz') and name not in (payload['arrays'], previous):
+            os.remove(os.path.join(directory, name))
+
+
+def load_state(directory):
+    with open(os.path.join(directory, 'state.json'), encoding='utf-8') as f:
+        state = json.load(f)
+    state['scaling'] = {col: tuple(params) for col, params in state['scaling'].items()}
+    with np.load(os.path.join(directory, state.pop('arrays', 'arrays.npz'))) as arrays:
+        state['hashes'] = arrays['hashes']
+        state['samples'] = {
+            col: arrays[f'sample_{i}'] for i, col in enumerate(state['numeric'])
+            if f'sample_{i}' in arrays
+        }
+    return state
@@ -0,0 +1,165 @@
+"""Test de charge : trafic concurrent /api/analyze + /api/process sur un serveur local.
+
+Sans --url, lance gunicorn (gunicorn.conf.py) dans un dossier temporaire avec
+une base SQLite jetable, puis envoie --requests cycles analyse → traitement
+répartis sur --concurrency threads. Rapporte le débit et les latences p50/p95/p99.
+
+Usage : python load_test.py [--concurrency 8] [--requests 100] [--rows 2000]
+        python load_test.py --url http://localhost:5000 --username admin --password ...
+"""
+import argparse
+import io
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def build_csv(rows):
+    buffer = io.StringIO()
+    buffer.write('id,age,salaire,ville\n')
+    for i in range(rows):
+        age = '' if i % 17 == 0 else 20 + i % 50
+        salaire = 1_000_000 if i % 101 == 0 else 30000 + (i * 37) % 40000
+        buffer.write(f"{i % (rows - rows // 20)},{age},{salaire},ville{i % 7}\n")
+    return buffer.getvalue().encode()
+
+
+def post(url, body, headers):
+    req = urllib.request.Request(url, data=body, headers=headers, method='POST')
+    with urllib.request.urlopen(req, timeout=120) as resp:
+        return json.loads(resp.read())
+
+
+def post_json(url, payload, token=None):
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    return post(url, json.dumps(payload).encode(), headers)
+
+
+def post_file(url, filename, content, token):
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f'Content-Type: text/csv\r\n\r\n'
+    ).encode() + content + f'\r\n--{boundary}--\r\n'.encode()
+    return post(url, body, {
+        'Content-Type': f'multipart/form-data; boundary={boundary}',
+        'Authorization': f'Bearer {token}'
+    })
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workdir, port, password):
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'load.db')}",
+        ADMIN_PASSWORD=password,
+        PORT=str(port),
+        PYTHONPATH=ROOT,
+    )
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'],
+                   cwd=workdir, env=env, check=True, capture_output=True)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'), 'app:app'],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/api/status', timeout=1)
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("Le serveur n'a pas démarré")
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def run(base_url, token, args):
+    # Un contenu distinct par cycle : le cache d'analyse ne fausse pas la mesure
+    payloads = [build_csv(args.rows) + f'{i},30,40000,unique\n'.encode() for i in range(args.requests)]
+    latencies = {'analyze': [], 'process': []}
+    errors = []
+
+    def cycle(i):
+        filename = f'load_{i}_{uuid.uuid4().hex[:8]}.csv'
+        try:
+            start = time.perf_counter()
+            post_file(f'{base_url}/api/analyze', filename, payloads[i], token)
+            middle = time.perf_counter()
+            post_json(f'{base_url}/api/process', {'filename': filename, 'options': {}}, token)
+            end = time.perf_counter()
+            latencies['analyze'].append(middle - start)
+            latencies['process'].append(end - middle)
+        except (OSError, ValueError) as e:
+            errors.append(str(e))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(cycle, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    total = len(latencies['analyze']) + len(latencies['process'])
+    print(f"{args.requests} cycles, concurrence {args.concurrency}, {args.rows} lignes/fichier")
+    print(f"durée {elapsed:.2f} s, débit {total / elapsed:.1f} req/s, erreurs {len(errors)}")
+    for name, values in latencies.items():
+        if values:
+            print(f"{name:8s} p50 {statistics.median(values) * 1000:7.1f} ms  "
+                  f"p95 {percentile(values, 0.95) * 1000:7.1f} ms  "
+                  f"p99 {percentile(values, 0.99) * 1000:7.1f} ms")
+    for error in errors[:5]:
+        print(f"  erreur : {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help="serveur existant (sinon gunicorn local)")
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='loadtest-admin')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--rows', type=int, default=2000)
+    args = parser.parse_args()
+
+    server = None
+    workdir = tempfile.TemporaryDirectory()
+    try:
+        if args.url:
+            base_url = args.url.rstrip('/')
+        else:
+            port = free_port()
+            server = start_server(workdir.name, port, args.password)
+            base_url = f'http://127.0.0.1:{port}'
+        token = post_json(f'{base_url}/api/login',
+                          {'username': args.username, 'password': args.password})['token']
+        run(base_url, token, args)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+        workdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,7 @@ export class DashboardComponent implements OnInit {
   username: string | null = null;
   stats: any = {};
   files: any[] = [];
+  nextCursor: number | null = null;
   private apiUrl = '/api';
 
   constructor(
@@ -40,7 +41,25 @@ export class DashboardComponent implements OnInit {
   loadFiles() {
     const headers = this.authService.getAuthHeaders();
     this.http.get(`${this.apiUrl}/files`, { headers }).subscribe({
-      next: (data: any) => this.files = data.files,
+      next: (data: any) => {
+        this.files = data.files;
+        this.nextCursor = data.next_cursor ?? null;
+      },
+      error: (err) => console.error(err)
+    });
+  }
+
+  // L'historique est paginé côté API : on suit next_cursor pour la page suivante
+  loadMoreFiles() {
+    if (this.nextCursor === null) {
+      return;
+    }
+    const headers = this.authService.getAuthHeaders();
+    this.http.get(`${this.apiUrl}/files`, { headers, params: { before_id: this.nextCursor } }).subscribe({
+      next: (data: any) => {
+        this.files = [...this.files, ...data.files];
+        this.nextCursor = data.next_cursor ?? null;
+      },
       error: (err) => console.error(err)
     });
   }
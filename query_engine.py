@@ -0,0 +1,185 @@
+import math
+import os
+import uuid
+
+# Taille des row groups Parquet : chacun porte ses statistiques min/max par colonne,
+# ce qui permet d'ignorer sans les lire ceux qu'un filtre exclut.
+ROW_GROUP_SIZE = 65536
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+FILTER_OPERATORS = {'==', '!=', '<', '<=', '>', '>=', 'in'}
+AGGREGATIONS = {'count', 'count_distinct', 'sum', 'mean', 'min', 'max'}
+
+
+def write_columnar(df, path):
+    """Écrit df en Parquet (par fichier temporaire renommé atomiquement)."""
+    import pyarrow as pa
+
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        try:
+            df.to_parquet(tmp_path, index=False, row_group_size=ROW_GROUP_SIZE)
+        except (pa.ArrowTypeError, pa.ArrowInvalid):
+            # Colonnes object de types mélangés : stockées comme texte
+            df = df.copy()
+            for col in df.select_dtypes(include=['object']).columns:
+                df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+            df.to_parquet(tmp_path, index=False, row_group_size=ROW_GROUP_SIZE)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _filter_expression(filters, schema):
+    import pyarrow.dataset as ds
+
+    expression = None
+    for spec in filters:
+        if not isinstance(spec, dict):
+            raise ValueError("Chaque filtre doit être un objet {column, op, value}.")
+        column, op, value = spec.get('column'), spec.get('op', '=='), spec.get('value')
+        if column not in schema.names:
+            raise ValueError(f"Colonne inconnue dans le filtre : {column}")
+        if op not in FILTER_OPERATORS:
+            raise ValueError(f"Opérateur invalide : {op}. Valeurs acceptées : {FILTER_OPERATORS}")
+
+        field = ds.field(column)
+        if op == 'in':
+            if not isinstance(value, list):
+                raise ValueError("L'opérateur 'in' attend une liste de valeurs.")
+            condition = field.isin(value)
+        elif op == '==':
+            condition = field == value
+        elif op == '!=':
+            condition = field != value
+        elif op == '<':
+            condition = field < value
+        elif op == '<=':
+            condition = field <= value
+        elif op == '>':
+            condition = field > value
+        else:
+            condition = field >= value
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def _as_list(value, name):
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        raise ValueError(f"{name} doit être une liste.")
+    return value
+
+
+def _json_safe(value):
+    if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+        return None
+    return value
+
+
+def _sorted(table, sort):
+    if not sort:
+        return table
+    keys = []
+    for spec in sort:
+        if not isinstance(spec, dict) or spec.get('column') not in table.column_names:
+            raise ValueError(f"Tri invalide : {spec}. Colonnes disponibles : {table.column_names}")
+        order = 'descending' if spec.get('order') == 'desc' else 'ascending'
+        keys.append((spec['column'], order))
+    return table.sort_by(keys)
+
+
+def run_query(path, query):
+    """Exécute filtre, projection, agrégation, tri et pagination sur un fichier Parquet.
+
+    Seules les colonnes nécessaires sont lues, et les row groups dont les
+    statistiques min/max excluent le filtre ne sont pas lus du tout.
+    Lève ValueError si la requête est invalide.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+
+    if not isinstance(query, dict):
+        raise ValueError("La requête doit être un objet JSON.")
+
+    dataset = ds.dataset(path, format='parquet')
+    schema = dataset.schema
+
+    columns = _as_list(query.get('columns'), 'columns')
+    group_by = _as_list(query.get('group_by'), 'group_by')
+    aggregations = _as_list(query.get('aggregations'), 'aggregations')
+    sort = _as_list(query.get('sort'), 'sort')
+    expression = _filter_expression(_as_list(query.get('filters'), 'filters'), schema)
+
+    limit = query.get('limit', DEFAULT_LIMIT)
+    offset = query.get('offset', 0)
+    if not isinstance(limit, int) or not isinstance(offset, int) or limit < 1 or offset < 0:
+        raise ValueError("limit doit être un entier positif et offset un entier positif ou nul.")
+    limit = min(limit, MAX_LIMIT)
+
+    aggregate_specs = []
+    for spec in aggregations:
+        if not isinstance(spec, dict):
+            raise ValueError("Chaque agrégation doit être un objet {column, func}.")
+        column, func = spec.get('column'), spec.get('func')
+        if func not in AGGREGATIONS:
+            raise ValueError(f"Agrégation invalide : {func}. Valeurs acceptées : {AGGREGATIONS}")
+        aggregate_specs.append((column, func))
+
+    # Projection : uniquement les colonnes utiles à la requête
+    if group_by or aggregate_specs:
+        needed = list(group_by) + [column for column, _ in aggregate_specs]
+    else:
+        needed = list(columns) or list(schema.names)
+        needed += [s.get('column') for s in sort if isinstance(s, dict) and s.get('column') not in needed]
+    needed = list(dict.fromkeys(needed))
+    unknown = [column for column in needed if column not in schema.names]
+    if unknown:
+        raise ValueError(f"Colonnes inconnues : {unknown}")
+
+    # Statistiques d'élagage : row groups retenus d'après leurs min/max
+    row_groups_total = 0
+    row_groups_scanned = 0
+    for fragment in dataset.get_fragments():
+        row_groups_total += fragment.metadata.num_row_groups
+        row_groups_scanned += len(fragment.split_by_row_group(expression)) if expression is not None \
+            else fragment.metadata.num_row_groups
+
+    table = dataset.to_table(columns=needed, filter=expression)
+    matched_rows = table.num_rows
+
+    if group_by:
+        table = _sorted(table.group_by(group_by).aggregate(aggregate_specs), sort)
+    elif aggregate_specs:
+        table = _sorted(pa.table({
+            f"{column}_{func}": [getattr(pc, func)(table[column]).as_py()]
+            for column, func in aggregate_specs
+        }), sort)
+    else:
+        # Tri avant projection : la colonne de tri peut ne pas être demandée
+        table = _sorted(table, sort)
+        if columns:
+            table = table.select(columns)
+
+    total = table.num_rows
+    page = table.slice(offset, limit)
+    return {
+        'columns': page.column_names,
+        'rows': [
+            {key: _json_safe(value) for key, value in row.items()}
+            for row in page.to_pylist()
+        ],
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'scan': {
+            'matched_rows': matched_rows,
+            'columns_read': needed,
+            'row_groups_scanned': row_groups_scanned,
+            'row_groups_total': row_groups_total
+        }
+    }
@@ -0,0 +1,106 @@
+import math
+import numpy as np
+import pandas as pd
+
+
+def row_hashes(df, subset=None):
+    """Empreinte 64 bits par ligne, indépendante du dtype (int/float, object/string).
+
+    Une même ligne lue dans un bloc int64 puis dans un bloc float64 (NaN
+    apparus entre-temps) garde la même empreinte.
+    """
+    frame = df[subset] if subset else df
+    normalized = pd.DataFrame({
+        col: (frame[col].astype(np.float64) if pd.api.types.is_numeric_dtype(frame[col])
+              else frame[col].astype(object))
+        for col in frame.columns
+    })
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+
+
+class ReservoirSample:
+    """Échantillon uniforme de taille fixe sur un flux (algorithme R, vectorisé par bloc).
+
+    Sert aussi de sketch de quantiles : d'après l'inégalité DKW, l'erreur de rang
+    d'un quantile estimé sur k valeurs est au plus rank_error() avec probabilité 1 - delta.
+    """
+
+    def __init__(self, size, rng):
+        self.size = size
+        self.rng = rng
+        self.values = np.empty(size, dtype=np.float64)
+        self.filled = 0
+        self.seen = 0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+
+        # Remplissage initial du réservoir
+        free = min(self.size - self.filled, len(values))
+        if free > 0:
+            self.values[self.filled:self.filled + free] = values[:free]
+            self.filled += free
+            self.seen += free
+            values = values[free:]
+        if len(values) == 0:
+            return
+
+        # L'élément de position i (1-indexée) remplace une case au hasard avec probabilité size / i
+        positions = np.arange(self.seen + 1, self.seen + len(values) + 1)
+        slots = (self.rng.random(len(values)) * positions).astype(np.int64)
+        keep = slots < self.size
+        self.values[slots[keep]] = values[keep]
+        self.seen += len(values)
+
+    def sample(self):
+        return self.values[:self.filled]
+
+    def quantile(self, q):
+        return float(np.quantile(self.sample(), q))
+
+    def rank_error(self, delta=0.05):
+        if self.filled == 0 or self.filled == self.seen:
+            return 0.0
+        return math.sqrt(math.log(2 / delta) / (2 * self.filled))
+
+
+class HyperLogLog:
+    """Estimation du nombre d'éléments distincts en mémoire constante (2^precision registres)."""
+
+    HASH_BITS = 64
+
+    def __init__(self, precision=14):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    def update_hashes(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if len(hashes) == 0:
+            return
+        rest_bits = self.HASH_BITS - self.precision
+        index = (hashes >> np.uint64(rest_bits)).astype(np.int64)
+        rest = (hashes & np.uint64((1 << rest_bits) - 1)).astype(np.float64)
+        # rest < 2^50 est exact en float64 : frexp donne la longueur binaire sans arrondi
+        _, bit_length = np.frexp(rest)
+        rank = (rest_bits - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def update_frame(self, df):
+        """Ajoute chaque ligne du DataFrame (hachée sur l'ensemble des colonnes)."""
+        self.update_hashes(row_hashes(df))
+
+    def estimate(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / float(np.sum(np.ldexp(1.0, -self.registers.astype(np.int64))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        # Correction petite cardinalité (comptage linéaire)
+        if raw <= 2.5 * m and zeros > 0:
+            return m * math.log(m / zeros)
+        return raw
+
+    def relative_error(self):
+        return 1.04 / math.sqrt(self.m)